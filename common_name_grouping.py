@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+CSVファイルを1回だけ読み込んで、英語名・日本語名ごとに学名をグループ化したJSONLファイルを生成する
+"""
+
+import csv
+import orjson
+from collections import defaultdict
+
+# JSONL出力時のバッファサイズと一度に書き込む行数
+WRITE_BUFFER_SIZE = 64 * 1024
+WRITE_CHUNK_LINES = 1024
+
+# 該当するコモンネームがないことを表す値（グループ化の対象外）
+NO_COMMON_NAMES = {
+    "english_common_name": "None",
+    "japanese_common_name": "なし",
+}
+
+
+def group_scientific_names(input_csv: str, key_columns: list[str]) -> tuple[dict[str, dict[str, list[str]]], dict[str, int]]:
+    """
+    CSVを1回の走査で読み込み、指定した各列の値ごとに学名をグループ化
+
+    Args:
+        input_csv: 入力CSVファイルパス（拡張子が .parquet ならParquetとして読み込む）
+        key_columns: グループ化のキーにする列名のリスト
+
+    Returns:
+        列名ごとの「コモンネーム -> 学名リスト」と、列名ごとの総学名数
+    """
+    groups = {key_column: defaultdict(list) for key_column in key_columns}
+    counts = dict.fromkeys(key_columns, 0)
+
+    if input_csv.endswith('.parquet'):
+        # Parquetは必要な列だけを読み込み、行のタプルに並べ直す
+        import pyarrow.parquet as pq
+        columns = pq.read_table(input_csv, columns=['scientific_name', *key_columns]).to_pydict()
+        header = list(columns)
+        _group_rows(zip(*columns.values()), header, key_columns, groups, counts)
+    else:
+        with open(input_csv, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            _group_rows(reader, header, key_columns, groups, counts)
+
+    return groups, counts
+
+
+def _group_rows(rows, header: list[str], key_columns: list[str],
+                groups: dict[str, dict[str, list[str]]], counts: dict[str, int]):
+    """行を走査して、列ごとのグループと総学名数に追加"""
+    # ヘッダーから列の位置を一度だけ求める
+    scientific_name_index = header.index('scientific_name')
+    key_indexes = [
+        (key_column, header.index(key_column), groups[key_column], NO_COMMON_NAMES.get(key_column))
+        for key_column in key_columns
+    ]
+    # 再処理で同じ学名が追記されている場合は最後の行（最新の結果）だけを使う
+    # 書き込み途中で終了した最終行のように列が欠けた行は無視する
+    latest_rows = {row[scientific_name_index]: row for row in rows if len(row) == len(header)}
+    for scientific_name, row in latest_rows.items():
+        for key_column, key_index, name_to_scientific_names, no_common_name in key_indexes:
+            common_name = row[key_index]
+            if common_name == no_common_name:
+                continue
+            name_to_scientific_names[common_name].append(scientific_name)
+            counts[key_column] += 1
+
+
+def write_grouped_jsonl(output_jsonl: str, key_column: str, name_to_scientific_names: dict[str, list[str]]):
+    """
+    グループ化した学名をコモンネーム順にJSONLに出力
+
+    Args:
+        output_jsonl: 出力JSONLファイルパス
+        key_column: JSONのキーにする列名
+        name_to_scientific_names: コモンネーム -> 学名リスト
+    """
+    # 一定行数ずつまとめて書き込み、write の呼び出し回数を減らす
+    # orjson は UTF-8 のバイト列を直接返すため、バイナリモードで書き込む
+    with open(output_jsonl, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        chunk = []
+        # キーは重複しないため、(キー, リスト) のタプルではなくキーだけを並べ替える
+        # 入力が既にコモンネーム順なら Timsort は1回の走査で終わる
+        for common_name in sorted(name_to_scientific_names):
+            json_obj = {
+                key_column: common_name,
+                "scientific_name_list": name_to_scientific_names[common_name]
+            }
+            chunk.append(orjson.dumps(json_obj) + b'\n')
+            if len(chunk) >= WRITE_CHUNK_LINES:
+                f.write(b''.join(chunk))
+                chunk.clear()
+        f.write(b''.join(chunk))
+
+
+def csv_to_jsonl_both(
+    input_csv: str = "jp_en_common_name.csv",
+    en_output_jsonl: str = "english_name_grouped.jsonl",
+    jp_output_jsonl: str = "japanese_name_grouped.jsonl"
+):
+    """
+    英語名・日本語名の両方を含むCSVを1回だけ読み込み、両方のJSONLを生成
+
+    Args:
+        input_csv: 入力CSVファイルパス
+        en_output_jsonl: 英語名ごとの出力JSONLファイルパス
+        jp_output_jsonl: 日本語名ごとの出力JSONLファイルパス
+    """
+    groups, counts = group_scientific_names(input_csv, ['english_common_name', 'japanese_common_name'])
+    write_grouped_jsonl(en_output_jsonl, 'english_common_name', groups['english_common_name'])
+    write_grouped_jsonl(jp_output_jsonl, 'japanese_common_name', groups['japanese_common_name'])
+
+    # 統計情報を表示
+    print(f"処理完了:")
+    print(f"  入力: {input_csv}")
+    print(f"  出力: {en_output_jsonl}, {jp_output_jsonl}")
+    print(f"  英語名の種類: {len(groups['english_common_name'])} (総学名数: {counts['english_common_name']})")
+    print(f"  日本語名の種類: {len(groups['japanese_common_name'])} (総学名数: {counts['japanese_common_name']})")
+
+
+if __name__ == "__main__":
+    csv_to_jsonl_both()
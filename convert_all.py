@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+英語名・日本語名のCSV→JSONL変換を別プロセスで並列に実行する
+"""
+
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+# 実行する変換スクリプト（モジュール名）
+CONVERTER_MODULES = ["en_csv_to_jsonl", "jp_csv_to_jsonl"]
+
+
+def _run(module_name: str):
+    """指定したモジュールの csv_to_jsonl を既定の入出力パスで実行"""
+    importlib.import_module(module_name).csv_to_jsonl()
+
+
+def main():
+    # 2つの変換は互いに独立しているため、プロセスを分けて同時に実行
+    with ProcessPoolExecutor(max_workers=len(CONVERTER_MODULES)) as executor:
+        list(executor.map(_run, CONVERTER_MODULES))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,171 +4,295 @@ import time
 import re
 import argparse
 import asyncio
+import heapq
+import mmap
+import hashlib
 from pathlib import Path
-from openai import AsyncOpenAI
+from typing import NamedTuple
+import httpx
+from aiolimiter import AsyncLimiter
+import msgspec
+from diskcache import Cache
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError
 from dotenv import load_dotenv
-from pydantic import BaseModel
 
 # 環境変数を読み込み
 load_dotenv()
 
-# OpenAI 非同期クライアントの初期化
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# コモンネームの後処理で使うパターン
+# 先頭の空白と「呼称:」「Common Name:」などのプレフィックス（重なっていてもすべて）を読み飛ばし、最初の1行だけを取り出す
+_JA_CLEAN = re.compile(r'\s*(?:(?:呼称|日本語名)[:：]\s*)*([^\n]*)')
+_EN_CLEAN = re.compile(r'\s*(?:(?:Common Name|Name):\s*)*([^\n]*)', re.IGNORECASE)
 
+# 前後から取り除く引用符と空白（str.strip() が除去する空白文字をすべて含める）
+_WHITESPACE_CHARS = ''.join(chr(code) for code in range(0x3001) if chr(code).isspace())
+_JA_STRIP_CHARS = '「」『』"\'' + _WHITESPACE_CHARS
+_EN_STRIP_CHARS = '"\'' + _WHITESPACE_CHARS
 
-class CommonNameResponse(BaseModel):
-    """構造化された応答モデル（英語用）"""
-    common_name: str
+# 取得済みのコモンネームを保存するディスクキャッシュ（main_async で初期化）
+cache: Cache | None = None
+
+# コモンネームを取得できなかった場合に出力する値
+ERROR_COMMON_NAME = "エラー"
+
+# 出力CSVのバッファサイズとフラッシュ間隔（件数）
+WRITE_BUFFER_SIZE = 64 * 1024
+FLUSH_INTERVAL = 100
+
+# Parquet出力の行グループサイズ
+PARQUET_ROW_GROUP_SIZE = 1024
+
+# OpenAI 非同期クライアント（main_async で初期化）
+client: AsyncOpenAI | None = None
 
+# API呼び出しの同時実行数を制限するセマフォ（main_async で初期化）
+semaphore: asyncio.Semaphore | None = None
 
-class JapaneseCommonNameResponse(BaseModel):
-    """構造化された応答モデル（日本語用）"""
+# 1分あたりのAPIリクエスト数を制限するリミッター（main_async で初期化）
+limiter: AsyncLimiter | None = None
+
+
+class CommonNameResponse(msgspec.Struct, frozen=True, forbid_unknown_fields=True, gc=False):
+    """構造化された応答モデル（英語名・日本語名）"""
+    scientific_name: str
+    common_name: str
     呼称: str
 
 
-def load_prompt_template(prompt_path: str) -> str:
-    """プロンプトテンプレートを読み込む"""
+class CommonNameBatchResponse(msgspec.Struct, frozen=True, forbid_unknown_fields=True, gc=False):
+    """複数の学名をまとめて問い合わせる応答モデル"""
+    items: list[CommonNameResponse]
+
+
+class PromptTemplate(NamedTuple):
+    """[species] の前後に分割したプロンプトテンプレートと、キャッシュキー用のハッシュ"""
+    prefix: str
+    suffix: str
+    prompt_hash: str
+
+
+def create_response_format(response_type: type[msgspec.Struct]) -> dict:
+    """応答モデルから Structured Outputs 用の response_format を作成"""
+    # ルートはオブジェクトである必要があるため、$ref を展開して残りを $defs にまとめる
+    _, components = msgspec.json.schema_components([response_type], ref_template="#/$defs/{name}")
+    schema = components.pop(response_type.__name__)
+    if components:
+        schema["$defs"] = components
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": response_type.__name__, "schema": schema, "strict": True},
+    }
+
+
+# Structured Outputs 用の response_format（スキーマは起動時に一度だけ生成）
+RESPONSE_FORMAT = create_response_format(CommonNameBatchResponse)
+
+
+def create_client(max_connections: int) -> AsyncOpenAI:
+    """コネクションプールを共有するOpenAI非同期クライアントを作成"""
+    # HTTP/2 とキープアライブで接続・TLSハンドシェイクを使い回す
+    # リトライは get_common_names 側で行うため、トランスポートでも SDK でも再試行しない
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        http2=True,
+        retries=0,
+    )
+    http_client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(60.0, connect=10.0))
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """エラー応答の retry-after ヘッダーから待機秒数を取得"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def load_prompt_template(prompt_path: str) -> PromptTemplate:
+    """プロンプトテンプレートを読み込み、[species] の前後に分割してハッシュを求める"""
     with open(prompt_path, 'r', encoding='utf-8') as f:
-        return f.read()
+        prompt_template = f.read()
+    
+    if '[species]' not in prompt_template:
+        raise ValueError(f"{prompt_path} に [species] が含まれていません")
+    
+    prefix, suffix = prompt_template.split('[species]', 1)
+    prompt_hash = hashlib.blake2s(prompt_template.encode('utf-8')).hexdigest()
+    return PromptTemplate(prefix, suffix, prompt_hash)
 
 
 def load_species_list(species_path: str) -> list[str]:
-    """学名リストを読み込む"""
-    with open(species_path, 'r', encoding='utf-8') as f:
-        return [line.strip() for line in f if line.strip()]
+    """学名リストを読み込む（メモリマップで読み、空行以外だけをデコード）"""
+    with open(species_path, 'rb') as f:
+        # 空ファイルはメモリマップできない
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # bytes.strip() は ASCII の空白しか除かないため、デコードしてから strip する
+            stripped_lines = (line.decode('utf-8').strip() for line in iter(mm.readline, b''))
+            return [line for line in stripped_lines if line]
+
+
+def load_completed_species(output_path: str) -> set[str]:
+    """出力済みCSVから処理済みの学名を読み込む（エラーになった学名は再処理の対象にする）"""
+    if not os.path.exists(output_path):
+        return set()
+    
+    with open(output_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return set()
+        scientific_name_index = header.index('scientific_name')
+        en_common_name_index = header.index('english_common_name')
+        ja_common_name_index = header.index('japanese_common_name')
+        
+        # 同じ学名が追記されている場合は最後の行（最新の結果）を採用
+        # 書き込み途中で終了した最終行のように列が欠けた行は無視する
+        latest_rows = {row[scientific_name_index]: row for row in reader if len(row) == len(header)}
+    
+    return {
+        scientific_name
+        for scientific_name, row in latest_rows.items()
+        if ERROR_COMMON_NAME not in (row[en_common_name_index], row[ja_common_name_index])
+    }
+
+
+def export_parquet(output_path: str, parquet_path: str):
+    """出力CSVを行番号順に並べてParquetに変換（pyarrow が必要）"""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    
+    # "None" などの文字列が欠損値として読まれないよう、列の型を固定する
+    convert_options = pa_csv.ConvertOptions(column_types={
+        'number': pa.int32(),
+        'scientific_name': pa.string(),
+        'english_common_name': pa.string(),
+        'japanese_common_name': pa.string(),
+    })
+    table = pa_csv.read_csv(output_path, convert_options=convert_options)
+    pq.write_table(table.sort_by('number'), parquet_path, row_group_size=PARQUET_ROW_GROUP_SIZE)
+    print(f"Parquetに変換しました: {parquet_path} ({table.num_rows} 件)")
 
 
 def clean_common_name(common_name: str, language: str = "en") -> str:
     """コモンネームをクリーンアップする後処理"""
-    # 前後の空白を削除
-    common_name = common_name.strip()
-
     if language == "ja":
-        # 日本語の場合の後処理
-        # 「呼称:」「呼称：」などのプレフィックスを除去
-        patterns = [
-            r'^呼称[:：]\s*',
-            r'^日本語名[:：]\s*',
-        ]
-        for pattern in patterns:
-            common_name = re.sub(pattern, '', common_name)
-        
-        # 改行や余分な説明文を除去
-        if '\n' in common_name:
-            common_name = common_name.split('\n')[0].strip()
-        
-        # カギ括弧や引用符を除去
-        common_name = common_name.strip('「」『』""\'"')
-        
+        pattern, strip_chars = _JA_CLEAN, _JA_STRIP_CHARS
     else:
-        # 英語の場合の後処理
-        # "Common Name:" などのプレフィックスを除去
-        patterns = [
-            r'^Common Name:\s*',
-            r'^Name:\s*',
-        ]
-        for pattern in patterns:
-            common_name = re.sub(pattern, '', common_name, flags=re.IGNORECASE)
-        
-        # 改行や余分な説明文を除去
-        if '\n' in common_name:
-            common_name = common_name.split('\n')[0].strip()
-        
-        # 引用符を除去
-        common_name = common_name.strip('"\'')
-    
-    # 最終的な空白整理
-    common_name = common_name.strip()
+        pattern, strip_chars = _EN_CLEAN, _EN_STRIP_CHARS
     
-    return common_name
+    # プレフィックスと2行目以降の説明文を1回のマッチで除去し、引用符と空白をまとめて除去
+    # パターンはすべて省略可能なため、マッチは必ず成功する
+    return pattern.match(common_name).group(1).strip(strip_chars)
 
 
-async def get_common_name(species: str, prompt_template: str, model: str = "gpt-4o", language: str = "en", max_retries: int = 10) -> str:
-    """GPTを使って学名からコモンネームを取得(構造化された出力)"""
-    # プロンプトテンプレートの[species]を実際の学名に置き換え
-    prompt = prompt_template.replace('[species]', species)
+async def get_common_names(species_chunk: list[str], prompt_template: PromptTemplate, model: str = "gpt-4o", max_retries: int = 10) -> list[tuple[str, str]]:
+    """GPTを使って複数の学名から英語名・日本語名をまとめて取得(構造化された出力)"""
+    # 同じモデル・学名・プロンプトの結果はキャッシュから返す
+    # プロンプトのハッシュを含めるため、テンプレートを変更すればキャッシュは無効になる
+    prefix, suffix, prompt_hash = prompt_template
+    common_names = {}
+    for species in species_chunk:
+        cached_common_names = cache.get((model, species, prompt_hash))
+        if cached_common_names is not None:
+            common_names[species] = cached_common_names
     
-    # 言語に応じて適切なレスポンスフォーマットを選択
-    if language == "ja":
-        response_format = JapaneseCommonNameResponse
-    else:
-        response_format = CommonNameResponse
+    uncached_species = [species for species in species_chunk if species not in common_names]
+    if not uncached_species:
+        return [common_names[species] for species in species_chunk]
     
     for attempt in range(max_retries):
+        # プロンプトテンプレートの[species]の位置に未取得の学名の箇条書きを挟む
+        prompt = prefix + '\n'.join(f"- {species}" for species in uncached_species) + suffix
+        
         try:
-            response = await client.beta.chat.completions.parse(
-                model=model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                response_format=response_format,
-                max_tokens=200,
-                temperature=0.0,
-            )
+            async with semaphore, limiter:
+                # 起動直後に全チャンク分が表示されないよう、実際に送信する時点で表示する
+                print(f"処理中 ({uncached_species[0]} - {uncached_species[-1]}): {len(uncached_species)} 件")
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    response_format=RESPONSE_FORMAT,
+                    max_tokens=150 * len(uncached_species),
+                    temperature=0.0,
+                )
             
-            parsed_response = response.choices[0].message.parsed
-            if parsed_response:
-                if language == "ja":
-                    common_name = parsed_response.呼称
-                else:
-                    common_name = parsed_response.common_name
-            else:
-                common_name = "エラー"
+            # 応答のJSONを msgspec で直接デコード（不正な応答は空として再試行）
+            try:
+                items = msgspec.json.decode(response.choices[0].message.content or '', type=CommonNameBatchResponse).items
+            except msgspec.DecodeError:
+                items = []
             
-            # 後処理でクリーンアップ
-            common_name = clean_common_name(common_name, language)
+            # 応答を学名で対応付け、言語ごとに後処理でクリーンアップ
+            answers = {
+                item.scientific_name.strip(): (
+                    clean_common_name(item.common_name, "en"),
+                    clean_common_name(item.呼称, "ja"),
+                )
+                for item in items
+            }
             
-            return common_name
+            # 取得した結果をキャッシュに保存
+            for species in uncached_species:
+                if species in answers:
+                    common_names[species] = answers[species]
+                    cache[(model, species, prompt_hash)] = answers[species]
+            
+            # 応答に含まれなかった学名だけを再試行
+            uncached_species = [species for species in uncached_species if species not in answers]
+            if not uncached_species:
+                return [common_names[species] for species in species_chunk]
+            print(f"  Incomplete response ({len(uncached_species)} missing). Retrying (attempt {attempt + 1}/{max_retries})...")
+        
+        except RateLimitError as e:
+            # サーバーが待機時間を指定していればそれに従い、なければ徐々に待機時間を増やす
+            wait_time = get_retry_after(e) or 10 * (attempt + 1)
+            print(f"  Rate limit error. Waiting {wait_time} seconds before retry (attempt {attempt + 1}/{max_retries})...")
+            await asyncio.sleep(wait_time)
+        
+        except (APIConnectionError, APITimeoutError) as e:
+            # 通信エラーはすぐに再試行
+            print(f"  Connection error: {e}. Retrying (attempt {attempt + 1}/{max_retries})...")
         
         except Exception as e:
-            error_message = str(e)
-            if "429" in error_message or "rate_limit" in error_message.lower():
-                wait_time = 10 * (attempt + 1)  # 徐々に待機時間を増やす
-                print(f"  Rate limit error. Waiting {wait_time} seconds before retry (attempt {attempt + 1}/{max_retries})...")
-                await asyncio.sleep(wait_time)
-                if attempt == max_retries - 1:
-                    print(f"Error processing {species}: {e}")
-                    return "エラー"
-            else:
-                print(f"Error processing {species}: {e}")
-                return "エラー"
+            print(f"Error processing {', '.join(uncached_species)}: {e}")
+            break
+    else:
+        print(f"Error processing {', '.join(uncached_species)}: retries exhausted")
     
-    return "エラー"
+    return [common_names.get(species, (ERROR_COMMON_NAME, ERROR_COMMON_NAME)) for species in species_chunk]
 
 
-async def process_species(line_number: int, species: str, en_prompt_template: str, ja_prompt_template: str) -> dict:
-    """1つの学名を処理して結果を返す"""
-    print(f"処理中 ({line_number}): {species}")
-    
-    # 英語と日本語のコモンネームを並列取得
-    en_common_name, ja_common_name = await asyncio.gather(
-        get_common_name(species, en_prompt_template, language="en"),
-        get_common_name(species, ja_prompt_template, language="ja")
-    )
-    
-    print(f"  完了 ({line_number}): EN={en_common_name}, JA={ja_common_name}")
+async def process_species_chunk(chunk: list[tuple[int, str]], prompt_template: PromptTemplate, queue: asyncio.Queue) -> None:
+    """複数の学名をまとめて処理して結果を書き込みキューに送る"""
+    species_chunk = [species for _, species in chunk]
+
+    # 英語と日本語のコモンネームを1回のリクエストで取得
+    common_names = await get_common_names(species_chunk, prompt_template)
     
-    return {
-        'number': line_number,
-        'scientific_name': species,
-        'english_common_name': en_common_name,
-        'japanese_common_name': ja_common_name
-    }
+    for (line_number, species), (en_common_name, ja_common_name) in zip(chunk, common_names):
+        print(f"  完了 ({line_number}): EN={en_common_name}, JA={ja_common_name}")
+        
+        await queue.put({
+            'number': line_number,
+            'scientific_name': species,
+            'english_common_name': en_common_name,
+            'japanese_common_name': ja_common_name
+        })
 
 
-async def process_and_save_batch(species_list: list[str], start_line: int, end_line: int, 
-                                en_prompt_template: str, ja_prompt_template: str, 
-                                output_path: str, file_mode: str,
-                                batch_size: int = 10):
-    """バッチで並列処理し、バッチごとにCSVに保存"""
-    tasks = []
-    for i in range(start_line - 1, end_line):
-        species = species_list[i]
-        line_number = i + 1
-        tasks.append((line_number, process_species(line_number, species, en_prompt_template, ja_prompt_template)))
-    
+async def write_results(queue: asyncio.Queue, line_numbers: list[int], output_path: str, file_mode: str):
+    """キューから結果を受け取り、行番号順にCSVに保存（None を受け取ったら終了）"""
     # CSVファイルを開く（追記モードまたは新規作成）
-    with open(output_path, file_mode, newline='', encoding='utf-8') as f:
+    with open(output_path, file_mode, newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
         writer = csv.DictWriter(f, fieldnames=['number', 'scientific_name', 'english_common_name', 'japanese_common_name'])
         
         # 新規作成の場合のみヘッダーを書き込み
@@ -176,76 +300,136 @@ async def process_and_save_batch(species_list: list[str], start_line: int, end_l
             writer.writeheader()
             f.flush()
         
-        # バッチサイズごとに処理して保存
-        for i in range(0, len(tasks), batch_size):
-            batch = [task for _, task in tasks[i:i + batch_size]]
-            print(f"\nバッチ処理中: {i + 1} - {min(i + batch_size, len(tasks))} / {len(tasks)}")
-            batch_results = await asyncio.gather(*batch)
-            
-            # 行番号順にソートして保存
-            batch_results.sort(key=lambda x: x['number'])
+        # 完了順に受け取り、行番号順に並ぶまでヒープに保持する
+        waiting = []
+        saved_count = 0
+        while (result := await queue.get()) is not None:
+            heapq.heappush(waiting, (result['number'], result))
             
-            for row in batch_results:
+            while waiting and waiting[0][0] == line_numbers[saved_count]:
+                _, row = heapq.heappop(waiting)
                 writer.writerow(row)
-            
-            f.flush()  # バッファをフラッシュして即座にディスクに書き込む
-            print(f"  バッチ保存完了: {len(batch_results)} 件")
-            
-            # バッチ間で少し待機（レート制限対策）
-            if i + batch_size < len(tasks):
-                await asyncio.sleep(2)
+                saved_count += 1
+                
+                # 一定件数ごとにディスクへ書き出す
+                if saved_count % FLUSH_INTERVAL == 0 or saved_count == len(line_numbers):
+                    f.flush()
+                    print(f"  保存完了: {saved_count} / {len(line_numbers)} 件")
+                if saved_count == len(line_numbers):
+                    break
+        
+        # 途中で終了した場合も、前の行を待っていた結果は捨てずに行番号順で書き出す
+        if waiting:
+            print(f"  前の行が未完了のまま終了したため、待機中の {len(waiting)} 件を保存します")
+            while waiting:
+                _, row = heapq.heappop(waiting)
+                writer.writerow(row)
+        f.flush()
+
+
+async def process_and_save_batch(pending: list[tuple[int, str]], prompt_template: PromptTemplate,
+                                output_path: str, file_mode: str,
+                                batch_size: int = 10, chunk_size: int = 10):
+    """未処理の学名をチャンクごとに並列処理し、書き込み用タスクを通じて行番号順にCSVに保存"""
+    queue = asyncio.Queue(maxsize=2 * batch_size * chunk_size)
+    line_numbers = [line_number for line_number, _ in pending]
+    writer_task = asyncio.create_task(write_results(queue, line_numbers, output_path, file_mode))
+    
+    # 同時実行数はセマフォで制限されるため、タスクは一度に作成してよい
+    producers = asyncio.gather(*(
+        process_species_chunk(pending[i:i + chunk_size], prompt_template, queue)
+        for i in range(0, len(pending), chunk_size)
+    ))
+    try:
+        # 書き込みタスクが先に失敗した場合は、キューが詰まって止まらないよう処理中のタスクを取り消して例外を送出
+        await asyncio.wait({producers, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+        if writer_task.done() and writer_task.exception() is not None:
+            producers.cancel()
+            await asyncio.gather(producers, return_exceptions=True)
+            writer_task.result()
+        await producers
+    finally:
+        # 終了の合図を送り、書き込みの完了を待つ
+        if not writer_task.done():
+            await queue.put(None)
+        await writer_task
 
 
 async def main_async():
     # argparseを使用してコマンドライン引数を解析
     parser = argparse.ArgumentParser(description='学名からコモンネームを取得してCSVに保存します')
-    parser.add_argument('--start', type=int, default=1, help='処理を開始する行番号 (デフォルト: 1)')
+    parser.add_argument('--start', type=int, default=1, help='処理を開始する行番号。出力済みの学名は自動でスキップされます (デフォルト: 1)')
     parser.add_argument('--line', type=int, help='指定した行番号のみを処理')
-    parser.add_argument('--batch-size', type=int, default=10, help='並列処理のバッチサイズ (デフォルト: 10)')
+    parser.add_argument('--batch-size', type=int, default=10, help='同時に実行するAPIリクエスト数 (デフォルト: 10)')
+    parser.add_argument('--chunk-size', type=int, default=10, help='1回のAPIリクエストで問い合わせる学名の数 (デフォルト: 10)')
+    parser.add_argument('--parquet', action='store_true', help='処理完了後に出力CSVをParquetにも変換 (pyarrow が必要)')
+    parser.add_argument('--rpm', type=int, default=500, help='1分あたりのAPIリクエスト数の上限 (デフォルト: 500)')
     args = parser.parse_args()
     
     start_line = args.start
     single_line = args.line
     batch_size = args.batch_size
     
+    # API呼び出しの同時実行数とリクエストレートを制限
+    global client, semaphore, limiter, cache
+    semaphore = asyncio.Semaphore(batch_size)
+    limiter = AsyncLimiter(max_rate=args.rpm, time_period=60)
+    
     # ファイルパスの設定
-    en_prompt_path = "prompts/en-prompt.txt"
-    ja_prompt_path = "prompts/ja-prompt.txt"
+    prompt_path = "prompts/bilingual-prompt.txt"
     species_path = "mammal_species_confirmed.txt"
     output_path = "jp_en_common_name.csv"
+    parquet_path = "jp_en_common_name.parquet"
+    cache_path = ".gpt_cache"
     
     # プロンプトテンプレートを読み込み
     print("プロンプトテンプレートを読み込み中...")
-    en_prompt_template = load_prompt_template(en_prompt_path)
-    ja_prompt_template = load_prompt_template(ja_prompt_path)
+    prompt_template = load_prompt_template(prompt_path)
     
     print("学名リストを読み込み中...")
     species_list = load_species_list(species_path)
     print(f"合計 {len(species_list)} 件の学名")
     
+    # 既存のCSVファイルがあれば追記する
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        file_mode = 'a'
+    else:
+        file_mode = 'w'
+    
     # 単一行処理の場合
     if single_line is not None:
         print(f"指定行 {single_line} のみを処理します")
-        file_mode = 'a'
-        start_line = single_line
-        end_line = single_line
+        pending = [(single_line, species_list[single_line - 1])]
     else:
-        # 既存のCSVファイルをチェック
-        file_mode = 'w'
-        if start_line > 1 and os.path.exists(output_path):
-            file_mode = 'a'
-            print(f"既存のCSVファイルに追記します。{start_line}行目から開始...")
+        # 出力済みの学名はスキップして途中から再開する
+        completed_species = load_completed_species(output_path)
+        if completed_species:
+            print(f"既存のCSVファイルに追記します。処理済み {len(completed_species)} 件をスキップ...")
         
         print(f"開始行: {start_line}")
-        end_line = len(species_list)
+        pending = [
+            (line_number, species)
+            for line_number, species in enumerate(species_list[start_line - 1:], start_line)
+            if species not in completed_species
+        ]
+    
+    # 並列処理で全データを取得し、完了したものから順に保存
+    print(f"\n並列処理開始 (同時実行数: {batch_size})")
+    # 同時実行数分の接続をプールで確保
+    client = create_client(max_connections=batch_size)
+    cache = Cache(cache_path)
+    try:
+        await process_and_save_batch(pending, prompt_template, output_path, file_mode,
+                                     batch_size, args.chunk_size)
+    finally:
+        cache.close()
+        await client.close()
     
-    # 並列処理で全データを取得し、バッチごとに保存
-    print(f"\n並列処理開始 (バッチサイズ: {batch_size})")
-    await process_and_save_batch(species_list, start_line, end_line, 
-                                 en_prompt_template, ja_prompt_template, 
-                                 output_path, file_mode, batch_size)
+    print(f"\n完了! {len(pending)} 件のデータを処理しました")
     
-    print(f"\n完了! {end_line - start_line + 1} 件のデータを処理しました")
+    # 追記途中でも読めるCSVを正とし、Parquetは完了後にまとめて生成する
+    if args.parquet:
+        export_parquet(output_path, parquet_path)
 
 
 def main():